@@ -5,15 +5,19 @@
 """ Module defining the Charmed operator for the FINOS Legend Engine Server. """
 
 import base64
+import functools
+import hashlib
 import json
 import logging
-import subprocess
 
 from ops import charm
 from ops import framework
 from ops import main
 from ops import model
-import jks
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from charms.finos_legend_db_k8s.v0 import legend_database
 from charms.finos_legend_gitlab_integrator_k8s.v0 import legend_gitlab
@@ -26,11 +30,52 @@ ENGINE_CONFIG_FILE_CONTAINER_LOCAL_PATH = "/engine-config.json"
 ENGINE_SERVICE_URL_FORMAT = "%(schema)s://%(host)s:%(port)s%(path)s"
 ENGINE_GITLAB_REDIRECT_URI_FORMAT = "%(base_url)s/callback"
 
+# NOTE: a PKCS12 truststore would need the Java-specific "trusted
+# certificate" attribute set on its entries for the JVM to use them, which the
+# generic PKCS12 writers do not set. Trusted-certificate-only JKS stores only
+# involve a single SHA1 digest, so pyjks remains cheap enough to generate it:
 TRUSTSTORE_TYPE_JKS = "jks"
 TRUSTSTORE_NAME = "Legend Engine"
 TRUSTSTORE_PASSPHRASE = "Legend Engine"
 TRUSTSTORE_CONTAINER_LOCAL_PATH = "/truststore.jks"
 
+# Pebble config layer for the Engine, fully rendered once at import:
+ENGINE_PEBBLE_LAYER = {
+    "summary": "Engine layer.",
+    "description": "Pebble config layer for FINOS Legend Engine Server.",
+    "services": {
+        "engine": {
+            "override": "replace",
+            "summary": "engine",
+            "command": (
+                # NOTE(aznashwan): starting through bash is required
+                # for the classpath glob (-cp ...) to be expanded:
+                "/bin/sh -c 'java -XX:+ExitOnOutOfMemoryError -Xss4M "
+                "-XX:MaxRAMPercentage=60 -Dfile.encoding=UTF8 "
+                "-Djavax.net.ssl.trustStore=\"%s\" "
+                "-Djavax.net.ssl.trustStoreType=\"%s\" "
+                "-Djavax.net.ssl.trustStorePassword=\"%s\" "
+                "-cp /app/bin/*-shaded.jar org.finos.legend.engine."
+                "server.Server server %s'" % (
+                    TRUSTSTORE_CONTAINER_LOCAL_PATH,
+                    TRUSTSTORE_TYPE_JKS,
+                    TRUSTSTORE_PASSPHRASE,
+                    ENGINE_CONFIG_FILE_CONTAINER_LOCAL_PATH
+                )
+            ),
+            # NOTE(aznashwan): considering the Engine service expects
+            # a singular config file which already contains all
+            # relevant options in it (some of which will require the
+            # relation with Mongo/GitLab to have already been
+            # established), we do not auto-start:
+            "startup": "disabled",
+            # TODO(aznashwan): determine any env vars we could pass
+            # (most notably, things like the RAM percentage etc...)
+            "environment": {},
+        }
+    },
+}
+
 APPLICATION_ROOT_PATH = "/api"
 
 APPLICATION_CONNECTOR_TYPE_HTTP = "http"
@@ -40,10 +85,104 @@ APPLICATION_CONNECTOR_PORT_HTTPS = 6066
 
 APPLICATION_LOGGING_FORMAT = (
     "%d{yyyy-MM-dd HH:mm:ss.SSS} %-5p [%thread] %c - %m%n")
-VALID_APPLICATION_LOG_LEVEL_SETTINGS = [
-    "INFO", "WARN", "DEBUG", "TRACE", "OFF"]
+VALID_APPLICATION_LOG_LEVEL_SETTINGS = frozenset([
+    "INFO", "WARN", "DEBUG", "TRACE", "OFF"])
+
+# Charm config options which are restricted to a set of values:
+CHARM_CONFIG_VALID_VALUES = {
+    "server-logging-level": VALID_APPLICATION_LOG_LEVEL_SETTINGS,
+    "server-pac4j-logging-level": VALID_APPLICATION_LOG_LEVEL_SETTINGS,
+}
 
 GITLAB_REQUIRED_SCOPES = ["openid", "profile", "api"]
+# NOTE(aznashwan): needs to be a space-separated str:
+GITLAB_REQUIRED_SCOPES_STR = " ".join(GITLAB_REQUIRED_SCOPES)
+
+# Parts of the Engine config which do not depend on the charm's config
+# or relation data:
+ENGINE_LOGGING_APPENDERS = [{
+    "type": "console",
+    "logFormat": APPLICATION_LOGGING_FORMAT
+}]
+ENGINE_PAC4J_STATIC_CONFIG = {
+    "callbackPrefix": "",
+    "bypassPaths": ["/api/server/v1/info"],
+    "mongoSession": {
+        "enabled": True,
+        "collection": "userSessions"
+    }
+}
+GITLAB_CLIENT_STATIC_CONFIG = {
+    "name": "gitlab",
+    "scope": GITLAB_REQUIRED_SCOPES_STR
+}
+ENGINE_STATIC_CONFIG = {
+    # TODO(aznashwan): ask whether these options are
+    # relevant and/or worth exposing:
+    "opentracing": {
+        "elastic": "",
+        "zipkin": "",
+        "uri": "",
+        "authenticator": {
+            "principal": "",
+            "keytab": ""
+        }
+    },
+    "swagger": {
+        "title": "Legend Engine",
+        "resourcePackage": "org.finos.legend",
+        "uriPrefix": APPLICATION_ROOT_PATH
+    },
+    "server": {
+        "type": "simple",
+        "applicationContextPath": "/",
+        "adminContextPath": "/admin",
+        "requestLog": {"appenders": []},
+        "connector": {
+            "maxRequestHeaderSize": "32KiB",
+            "type": APPLICATION_CONNECTOR_TYPE_HTTP,
+            "port": APPLICATION_CONNECTOR_PORT_HTTP
+        },
+    },
+    # TODO(aznashwan): check whether this is how you reference the SDLC
+    "metadataserver": {
+        "pure": {
+            "host": "127.0.0.1",
+            "port": 8090
+        }
+    },
+    "vaults": []
+}
+
+REDACTED_LOG_VALUE = "<redacted>"
+
+
+def _get_redacted_engine_config(config: dict) -> dict:
+    """Returns a copy of the provided Engine config with the Mongo URI and
+    GitLab client secrets redacted, fit for being logged.
+    The provided config is not modified.
+    """
+    pac4j = dict(config["pac4j"], mongoUri=REDACTED_LOG_VALUE)
+    pac4j["clients"] = [{
+        client_type: dict(client, secret=REDACTED_LOG_VALUE)
+        for client_type, client in clients.items()}
+        for clients in pac4j["clients"]]
+    return dict(config, pac4j=pac4j)
+
+
+def _dump_json_bytes(obj) -> bytes:
+    """Serializes the provided object to compact JSON bytes with sorted keys,
+    using `orjson` if it is available.
+    """
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode()
+
+
+def _get_digest(data: bytes) -> str:
+    """Returns a short hex digest of the provided bytes for change detection.
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
 
 
 class LegendEngineServerCharm(charm.CharmBase):
@@ -55,11 +194,8 @@ class LegendEngineServerCharm(charm.CharmBase):
         super().__init__(*args)
 
         self._set_stored_defaults()
+        self._needs_reconfigure = False
 
-        self._legend_db_consumer = legend_database.LegendDatabaseConsumer(
-            self, relation_name="legend-db")
-        self._legend_gitlab_consumer = legend_gitlab.LegendGitlabConsumer(
-            self, relation_name="legend-engine-gitlab")
         self.ingress = ingress.IngressRequires(
             self, {
                 "service-hostname": self.app.name,
@@ -88,6 +224,12 @@ class LegendEngineServerCharm(charm.CharmBase):
             self.on["legend-engine-gitlab"].relation_changed,
             self._on_legend_gitlab_relation_changed)
 
+        # NOTE: reconfiguration requests from all the handlers
+        # running within the same hook are only acted upon once, right
+        # before the framework commits its state:
+        self.framework.observe(
+            self.framework.on.pre_commit, self._on_pre_commit)
+
         # Studio relation events:
         self.framework.observe(
             self.on["legend-engine"].relation_joined,
@@ -96,80 +238,70 @@ class LegendEngineServerCharm(charm.CharmBase):
             self.on["legend-engine"].relation_changed,
             self._on_studio_relation_changed)
 
+    # NOTE: the relation consumers do not observe any events, so
+    # they are only constructed on the hooks which actually make use of them:
+    @functools.cached_property
+    def _legend_db_consumer(self) -> legend_database.LegendDatabaseConsumer:
+        return legend_database.LegendDatabaseConsumer(
+            self, relation_name="legend-db")
+
+    @functools.cached_property
+    def _legend_gitlab_consumer(self) -> legend_gitlab.LegendGitlabConsumer:
+        return legend_gitlab.LegendGitlabConsumer(
+            self, relation_name="legend-engine-gitlab")
+
     def _set_stored_defaults(self) -> None:
-        self._stored.set_default(log_level="DEBUG")
-        self._stored.set_default(legend_db_credentials={})
-        self._stored.set_default(legend_gitlab_credentials={})
+        self._stored.set_default(
+            log_level="DEBUG",
+            legend_db_credentials={},
+            legend_gitlab_credentials={},
+            config_hash="",
+            truststore_hash="",
+            truststore_cert_b64="",
+            truststore_blob_b64="")
 
     def _on_engine_pebble_ready(self, event: framework.EventBase) -> None:
         """Define the Engine workload using the Pebble API.
-        Note that this will *not* start the service, but instead leave it in a
-        blocked state until the relevant relations required for it are added.
+        Note that this will *not* start the service by itself, but instead
+        request it be (re)configured, which will leave it in a blocked state
+        until the relevant relations required for it are added.
         """
         # Get a reference the container attribute on the PebbleReadyEvent
         container = event.workload
 
-        # Define an initial Pebble layer configuration
-        pebble_layer = {
-            "summary": "Engine layer.",
-            "description": "Pebble config layer for FINOS Legend Engine Server.",
-            "services": {
-                "engine": {
-                    "override": "replace",
-                    "summary": "engine",
-                    "command": (
-                        # NOTE(aznashwan): starting through bash is required
-                        # for the classpath glob (-cp ...) to be expanded:
-                        "/bin/sh -c 'java -XX:+ExitOnOutOfMemoryError -Xss4M "
-                        "-XX:MaxRAMPercentage=60 -Dfile.encoding=UTF8 "
-                        "-Djavax.net.ssl.trustStore=\"%s\" "
-                        "-Djavax.net.ssl.trustStorePassword=\"%s\" "
-                        "-cp /app/bin/*-shaded.jar org.finos.legend.engine."
-                        "server.Server server %s'" % (
-                            TRUSTSTORE_CONTAINER_LOCAL_PATH,
-                            TRUSTSTORE_PASSPHRASE,
-                            ENGINE_CONFIG_FILE_CONTAINER_LOCAL_PATH
-                        )
-                    ),
-                    # NOTE(aznashwan): considering the Engine service expects
-                    # a singular config file which already contains all
-                    # relevant options in it (some of which will require the
-                    # relation with Mongo/GitLab to have already been
-                    # established), we do not auto-start:
-                    "startup": "disabled",
-                    # TODO(aznashwan): determine any env vars we could pass
-                    # (most notably, things like the RAM percentage etc...)
-                    "environment": {},
-                }
-            },
-        }
-
         # Add intial Pebble config layer using the Pebble API
-        container.add_layer("engine", pebble_layer, combine=True)
+        container.add_layer("engine", ENGINE_PEBBLE_LAYER, combine=True)
+
+        # NOTE: a (re)started workload container will not have any
+        # of the files we had previously pushed, so we forget their hashes:
+        self._stored.config_hash = ""
+        self._stored.truststore_hash = ""
 
         # NOTE(aznashwan): as mentioned above, we will *not* be auto-starting
         # the service until the relations with Mongo and GitLab are added:
         # container.autostart()
 
-        self.unit.status = model.BlockedStatus(
-            "requires relating to: finos-legend-db-k8s, "
-            "finos-legend-gitlab-integrator-k8s")
+        self._reconfigure_engine_service()
 
-    def _get_logging_level_from_config(self, option_name) -> str:
-        """Fetches the config option with the given name and checks to
-        ensure that it is a valid `java.utils.logging` log level.
+    def _validate_charm_config(self, cfg) -> model.BlockedStatus:
+        """Checks all charm config options with a restricted set of possible
+        values against `CHARM_CONFIG_VALID_VALUES` in a single pass.
 
-        Returns None if an option is invalid.
+        Returns:
+            None if all of the options have valid values.
+            A `model.BlockedStatus` for the first invalid option otherwise.
         """
-        value = self.model.config[option_name]
-        if value not in VALID_APPLICATION_LOG_LEVEL_SETTINGS:
-            logger.warning(
-                "Invalid Java logging level value provided for option "
-                "'%s': '%s'. Valid Java logging levels are: %s. The charm "
-                "shall block until a proper value is set.",
-                option_name, value, VALID_APPLICATION_LOG_LEVEL_SETTINGS)
-            return None
-        return value
+        for option_name, valid_values in CHARM_CONFIG_VALID_VALUES.items():
+            value = cfg.get(option_name)
+            if value not in valid_values:
+                logger.warning(
+                    "Invalid value provided for option '%s': '%s'. Valid "
+                    "values are: %s. The charm shall block until a proper "
+                    "value is set.", option_name, value, sorted(valid_values))
+                return model.BlockedStatus(
+                    "invalid value for config option '%s', please review "
+                    "the debug-log for more details" % option_name)
+        return None
 
     def _add_base_service_config_from_charm_config(
             self, engine_config: dict = {}) -> model.BlockedStatus:
@@ -182,6 +314,8 @@ class LegendEngineServerCharm(charm.CharmBase):
             are present and have passed Charm-side valiation steps.
             A `model.BlockedStatus` instance with a relevant message otherwise.
         """
+        cfg = self.model.config
+
         # Check Mongo-related options:
         mongo_creds = self._stored.legend_db_credentials
         if not mongo_creds:
@@ -199,20 +333,17 @@ class LegendEngineServerCharm(charm.CharmBase):
         gitlab_openid_discovery_url = legend_gitlab_creds[
             'openid_discovery_url']
 
-        # Check Java logging options:
-        pac4j_logging_level = self._get_logging_level_from_config(
-            "server-pac4j-logging-level")
-        server_logging_level = self._get_logging_level_from_config(
-            "server-logging-level")
-        if not all([pac4j_logging_level, pac4j_logging_level]):
-            return model.BlockedStatus(
-                "one or more logging config options are improperly formatted "
-                "or missing, please review the debug-log for more details")
+        # Check config options with a restricted set of values:
+        possible_blocked_status = self._validate_charm_config(cfg)
+        if possible_blocked_status:
+            return possible_blocked_status
+        server_logging_level = cfg["server-logging-level"]
+        pac4j_logging_level = cfg["server-pac4j-logging-level"]
 
         # Compile base config:
         engine_config.update({
             "deployment": {
-                "mode": self.model.config['server-deployment-mode']
+                "mode": cfg['server-deployment-mode']
             },
             "logging": {
                 "level": server_logging_level,
@@ -224,85 +355,39 @@ class LegendEngineServerCharm(charm.CharmBase):
                         "level": pac4j_logging_level
                     }
                 },
-                "appenders": [{
-                    "type": "console",
-                    "logFormat": APPLICATION_LOGGING_FORMAT
-                }]
+                "appenders": ENGINE_LOGGING_APPENDERS
             },
-            "pac4j": {
-                "callbackPrefix": "",
-                "mongoUri": mongo_creds['uri'],
-                "mongoDb": mongo_creds['database'],
-                "bypassPaths": ["/api/server/v1/info"],
-                "clients": [{
-                    "org.finos.legend.server.pac4j.gitlab.GitlabClient": {
-                        "name": "gitlab",
-                        "clientId": gitlab_client_id,
-                        "secret": gitlab_client_secret,
-                        "discoveryUri": gitlab_openid_discovery_url,
-                        # NOTE(aznashwan): needs to be a space-separated str:
-                        "scope": " ".join(GITLAB_REQUIRED_SCOPES)
-                    }
-                }],
-                "mongoSession": {
-                    "enabled": True,
-                    "collection": "userSessions"
-                }
-            },
-            # TODO(aznashwan): ask whether these options are
-            # relevant and/or worth exposing:
-            "opentracing": {
-                "elastic": "",
-                "zipkin": "",
-                "uri": "",
-                "authenticator": {
-                    "principal": "",
-                    "keytab": ""
-                }
-            },
-            "swagger": {
-                "title": "Legend Engine",
-                "resourcePackage": "org.finos.legend",
-                "uriPrefix": APPLICATION_ROOT_PATH
-            },
-            "server": {
-                "type": "simple",
-                "applicationContextPath": "/",
-                "adminContextPath": "/admin",
-                "requestLog": {"appenders": []},
-                "connector": {
-                    "maxRequestHeaderSize": "32KiB",
-                    "type": APPLICATION_CONNECTOR_TYPE_HTTP,
-                    "port": APPLICATION_CONNECTOR_PORT_HTTP
-                },
-            },
-            # TODO(aznashwan): check whether this is how you reference the SDLC
-            "metadataserver": {
-                "pure": {
-                    "host": "127.0.0.1",
-                    "port": 8090
-                }
-            },
-            "vaults": []
+            "pac4j": dict(
+                ENGINE_PAC4J_STATIC_CONFIG,
+                mongoUri=mongo_creds['uri'],
+                mongoDb=mongo_creds['database'],
+                clients=[{
+                    "org.finos.legend.server.pac4j.gitlab.GitlabClient": dict(
+                        GITLAB_CLIENT_STATIC_CONFIG,
+                        clientId=gitlab_client_id,
+                        secret=gitlab_client_secret,
+                        discoveryUri=gitlab_openid_discovery_url)
+                }])
         })
+        # NOTE: the static sections are shared with the module-level
+        # templates instead of being copied, as the resulting config is only
+        # ever serialized and never mutated afterwards:
+        engine_config.update(ENGINE_STATIC_CONFIG)
 
         return None
 
-    def _update_engine_service_config(
-            self, container: model.Container, config: dict) -> None:
-        """Renders provided config to JSON and pushes it to the container
+    def _push_files_to_container(
+            self, container: model.Container, files: dict) -> None:
+        """Pushes all of the provided pre-rendered files to the container
         through the Pebble files API.
+
+        Args:
+            container: the `model.Container` to push the files into.
+            files: dict mapping container-local paths to their contents.
         """
-        logger.debug(
-            "Adding following config under '%s' in container: %s",
-            ENGINE_CONFIG_FILE_CONTAINER_LOCAL_PATH, config)
-        container.push(
-            ENGINE_CONFIG_FILE_CONTAINER_LOCAL_PATH,
-            json.dumps(config),
-            make_dirs=True)
-        logger.info(
-            "Successfully wrote config file '%s'",
-            ENGINE_CONFIG_FILE_CONTAINER_LOCAL_PATH)
+        for path, contents in files.items():
+            container.push(path, contents, make_dirs=True)
+            logger.info("Successfully wrote file '%s'", path)
 
     def _restart_engine_service(self, container: model.Container) -> None:
         """Restarts the Engine service using the Pebble container API.
@@ -311,10 +396,13 @@ class LegendEngineServerCharm(charm.CharmBase):
         container.restart("engine")
         logger.debug("Successfully issued Engine service restart")
 
-    def _write_java_truststore_to_container(self, container):
+    def _add_java_truststore_to_files(
+            self, files: dict) -> model.BlockedStatus:
         """Creates a Java jsk truststore from the certificate in the GitLab
-        relation data and adds it into the container under the appropriate
-        path.
+        relation data and adds it into the provided dict of files to be
+        pushed into the container under the appropriate path.
+        The serialized truststore is cached in the stored state and reused for
+        as long as the GitLab certificate does not change.
         Returns a `model.BlockedStatus` if any issue occurs.
         """
         gitlab_cert_b64 = self._stored.legend_gitlab_credentials.get(
@@ -331,35 +419,59 @@ class LegendEngineServerCharm(charm.CharmBase):
             return model.BlockedStatus("failed to decode b64 cert")
 
         keystore_dump = None
-        try:
-            cert_entry = jks.TrustedCertEntry.new(
-                TRUSTSTORE_NAME, gitlab_cert_raw)
-            keystore = jks.KeyStore.new(
-                TRUSTSTORE_TYPE_JKS, [cert_entry])
-            keystore_dump = keystore.saves(TRUSTSTORE_PASSPHRASE)
-        except Exception as ex:
-            logger.exception(ex)
-            return model.BlockedStatus(
-                "failed to create jks keystore: %s", str(ex))
+        if gitlab_cert_b64 == self._stored.truststore_cert_b64:
+            logger.debug("Reusing previously generated jks truststore")
+            keystore_dump = base64.b64decode(self._stored.truststore_blob_b64)
+        else:
+            # NOTE: pyjks and its dependencies are comparatively
+            # slow to import, and this is the only place it is needed in:
+            import jks
+
+            try:
+                cert_entry = jks.TrustedCertEntry.new(
+                    TRUSTSTORE_NAME, gitlab_cert_raw)
+                keystore = jks.KeyStore.new(
+                    TRUSTSTORE_TYPE_JKS, [cert_entry])
+                keystore_dump = keystore.saves(TRUSTSTORE_PASSPHRASE)
+            except Exception as ex:
+                logger.exception(ex)
+                return model.BlockedStatus(
+                    "failed to create jks keystore: %s" % ex)
+            self._stored.truststore_cert_b64 = gitlab_cert_b64
+            self._stored.truststore_blob_b64 = base64.b64encode(
+                keystore_dump).decode()
 
         logger.debug(
             "Adding jks trustore under '%s' in container",
             TRUSTSTORE_CONTAINER_LOCAL_PATH)
-        container.push(
-            TRUSTSTORE_CONTAINER_LOCAL_PATH,
-            keystore_dump,
-            make_dirs=True)
-        logger.info(
-            "Successfully wrote java truststore file to %s",
-            TRUSTSTORE_CONTAINER_LOCAL_PATH)
+        files[TRUSTSTORE_CONTAINER_LOCAL_PATH] = keystore_dump
+
+        return None
 
     def _reconfigure_engine_service(self) -> None:
+        """Flags the Engine service for reconfiguration at the end of the
+        current hook. See `_reconfigure_engine_service_now`.
+        """
+        self._needs_reconfigure = True
+
+    def _on_pre_commit(self, _) -> None:
+        """Performs any reconfiguration of the Engine service requested by
+        the handlers which ran during the current hook exactly once.
+        """
+        if self._needs_reconfigure:
+            self._needs_reconfigure = False
+            self._reconfigure_engine_service_now()
+
+    def _reconfigure_engine_service_now(self) -> None:
         """Generates the JSON config for the Engine server and adds it into
         the container via Pebble files API.
         - regenerating the JSON config for the Engine server
         - adding it via Pebble
         - instructing Pebble to restart the Engine server
         The Service is power-cycled for the new configuration to take effect.
+        The config file and truststore are only re-written (and the service
+        restarted) if their inputs differ from the ones last applied or they
+        are missing from the container.
         """
         config = {}
         possible_blocked_status = (
@@ -369,25 +481,57 @@ class LegendEngineServerCharm(charm.CharmBase):
             self.unit.status = possible_blocked_status
             return
 
+        config_bytes = _dump_json_bytes(config)
+        config_hash = _get_digest(config_bytes)
+        truststore_hash = _get_digest(
+            self._stored.legend_gitlab_credentials.get(
+                "gitlab_host_cert_b64", "").encode())
+
         container = self.unit.get_container("engine")
         if container.can_connect():
-            possible_blocked_status = (
-                self._write_java_truststore_to_container(
-                    container))
-            if possible_blocked_status:
-                self.unit.status = possible_blocked_status
-                return
-
-            logger.debug("Updating Engine service configuration")
-            self._update_engine_service_config(container, config)
-            self._restart_engine_service(container)
+            # NOTE: all files are rendered before any of them are pushed, so
+            # a rendering failure (e.g. a bad certificate) pushes nothing:
+            files = {}
+            truststore_stale = truststore_hash != self._stored.truststore_hash
+            if not truststore_stale:
+                truststore_stale = not container.exists(
+                    TRUSTSTORE_CONTAINER_LOCAL_PATH)
+            if truststore_stale:
+                possible_blocked_status = (
+                    self._add_java_truststore_to_files(files))
+                if possible_blocked_status:
+                    self.unit.status = possible_blocked_status
+                    return
+
+            config_stale = config_hash != self._stored.config_hash
+            if not config_stale:
+                config_stale = not container.exists(
+                    ENGINE_CONFIG_FILE_CONTAINER_LOCAL_PATH)
+            if config_stale:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        "Adding following config under '%s' in container: %s",
+                        ENGINE_CONFIG_FILE_CONTAINER_LOCAL_PATH, json.dumps(
+                            _get_redacted_engine_config(config), indent=2))
+                files[ENGINE_CONFIG_FILE_CONTAINER_LOCAL_PATH] = config_bytes
+
+            if files:
+                logger.debug("Updating Engine service configuration")
+                self._push_files_to_container(container, files)
+                self._stored.truststore_hash = truststore_hash
+                self._stored.config_hash = config_hash
+                self._restart_engine_service(container)
+            else:
+                logger.debug(
+                    "Engine service configuration unchanged, skipping restart")
             self.unit.status = model.ActiveStatus()
             return
 
+        # NOTE: the Engine will get configured by the reconfiguration
+        # requested from the pebble-ready handler once the container is up:
         logger.info("Engine container is not active yet. No config to update.")
-        self.unit.status = model.BlockedStatus(
-            "requires relating to: finos-legend-db-k8s, "
-            "finos-legend-gitlab-integrator-k8s")
+        self.unit.status = model.WaitingStatus(
+            "waiting for the Engine container to be ready")
 
     def _on_config_changed(self, _) -> None:
         """Reacts to configuration changes to the service by:
@@ -409,17 +553,26 @@ class LegendEngineServerCharm(charm.CharmBase):
                 "awaiting legend db relation data")
             event.defer()
             return
-        logger.debug(
-            "Mongo credentials returned by DB relation: %s",
-            mongo_creds)
-        self._stored.legend_db_credentials = mongo_creds
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Mongo credentials returned by DB relation: %s", {
+                    k: REDACTED_LOG_VALUE if k in ("password", "uri") else v
+                    for k, v in mongo_creds.items()})
+        if dict(self._stored.legend_db_credentials) != mongo_creds:
+            self._stored.legend_db_credentials = mongo_creds
 
         # Attempt to reconfigure and restart the service with the new data:
         self._reconfigure_engine_service()
 
-    def _get_engine_service_url(self):
-        ip_address = subprocess.check_output(
-            ["unit-get", "private-address"]).decode().strip()
+    def _get_engine_service_url(self, relation: model.Relation) -> str:
+        """Returns the URL of the Engine service on the address bound for the
+        provided relation, or None if no address is available for it yet.
+        """
+        ip_address = self.model.get_binding(relation).network.bind_address
+        if not ip_address:
+            logger.info(
+                "No address is bound for relation '%s' yet", relation.name)
+            return None
         return ENGINE_SERVICE_URL_FORMAT % ({
             # NOTE(aznashwan): we always return the plain HTTP endpoint:
             "schema": "http",
@@ -430,7 +583,12 @@ class LegendEngineServerCharm(charm.CharmBase):
     def _on_studio_relation_joined(
             self, event: charm.RelationJoinedEvent) -> None:
         rel = event.relation
-        engine_url = self._get_engine_service_url()
+        engine_url = self._get_engine_service_url(rel)
+        if not engine_url:
+            self.unit.status = model.WaitingStatus(
+                "waiting for the unit's network address")
+            event.defer()
+            return
         logger.info(
             "### Providing following Engine URL to Studio: %s", engine_url)
         rel.data[self.app]["legend-engine-url"] = engine_url
@@ -441,7 +599,12 @@ class LegendEngineServerCharm(charm.CharmBase):
 
     def _on_legend_gitlab_relation_joined(
             self, event: charm.RelationJoinedEvent) -> None:
-        base_url = self._get_engine_service_url()
+        base_url = self._get_engine_service_url(event.relation)
+        if not base_url:
+            self.unit.status = model.WaitingStatus(
+                "waiting for the unit's network address")
+            event.defer()
+            return
         redirect_uris = [
             ENGINE_GITLAB_REDIRECT_URI_FORMAT % {"base_url": base_url}]
 
@@ -468,7 +631,8 @@ class LegendEngineServerCharm(charm.CharmBase):
             event.defer()
             return
 
-        self._stored.legend_gitlab_credentials = gitlab_creds
+        if dict(self._stored.legend_gitlab_credentials) != gitlab_creds:
+            self._stored.legend_gitlab_credentials = gitlab_creds
         self._reconfigure_engine_service()
 
 